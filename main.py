@@ -1,48 +1,39 @@
+import asyncio
+import logging
 import os
-import smtplib
+from collections import defaultdict
 from datetime import date, datetime, timezone
 from email.mime.text import MIMEText
 from email.utils import formataddr
 from typing import Dict, Any
-from pathlib import Path
 
+import aiosmtplib
 import yfinance as yf
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from curl_cffi import requests as cureq
+from supabase import Client
 
+from supabase_client import get_client
 
+# LOG_LEVEL 環境変数でログ量を調整できるようにする（既定は INFO）
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
 
+# yfinance の全リクエストで TLS コネクションを使い回すための共有セッション
+_YF_SESSION = cureq.Session(impersonate="chrome")
 
 
-# =========================================================
-# Supabase クライアント初期化
-# =========================================================
-
-def create_supabase_client() -> Client:
-    """
-    main.py と同じフォルダの .env から
-    SUPABASE_URL / SUPABASE_SECRET_KEY を読み込んでクライアントを生成
-    """
-    env_path = Path(__file__).with_name(".env")
-    # OS環境変数より .env を優先させる
-    load_dotenv(dotenv_path=env_path, override=True)
 
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_SECRET_KEY")
 
-    # デバッグ用（確認できたらコメントアウトでOK）
-    print("DEBUG URL:", url)
-    print("DEBUG KEY length:", len(key) if key else 0)
 
-    if not url or not key:
-        raise RuntimeError(
-            "SUPABASE_URL / SUPABASE_SECRET_KEY が .env に設定されていません。"
-        )
-
-    return create_client(url, key)
+# =========================================================
+# Supabase クライアント初期化
+# =========================================================
 
-# グローバル Supabase クライアント
-supabase: Client = create_supabase_client()
+# グローバル Supabase クライアント（supabase_client.py で lru_cache 済み）
+supabase: Client = get_client()
 
 # =========================================================
 # 設定
@@ -74,16 +65,59 @@ SEVERITY_LABELS = {
 # yfinance から OHLC 取得
 # =========================================================
 
-def fetch_latest_ohlc(symbol_name: str, yf_symbol: str) -> Dict[str, Any]:
+async def load_latest_stored_rows() -> Dict[str, Dict[str, Any]]:
     """
-    指定シンボルの直近1日の OHLC を取得して、
-    Supabase に入れやすい dict にして返す。
-    取得できなければ RuntimeError を投げる。
+    volatility_prices からシンボルごとの最新行を取得する。
+    当日分がすでに upsert 済みのシンボルは yfinance を呼ばずに済ませるためのキャッシュ。
+    シンボルごとの select はワーカースレッドに逃がして並行に投げる。
     """
-    t = yf.Ticker(yf_symbol)
+    def fetch_one(symbol: str):
+        return (
+            supabase
+            .table(VOL_TABLE)
+            .select("*")
+            .eq("symbol", symbol)
+            .order("date", desc=True)
+            .limit(1)
+            .execute()
+        )
+
+    symbols = list(INDEX_TICKERS)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(fetch_one, symbol) for symbol in symbols)
+    )
+    return {
+        symbol: res.data[0]
+        for symbol, res in zip(symbols, results)
+        if res.data
+    }
 
-    # 直近数日取って、最後の1日分を使う
-    hist = t.history(period="5d", interval="1d")
+
+def download_all_history(tickers: Dict[str, str]):
+    """
+    渡されたシンボルを 1 回の yf.download でまとめて取得する。
+    シンボルごとに HTTP リクエストを投げるより大幅に速い。
+    戻り値はティッカーごとのマルチインデックス列を持つ DataFrame。
+    """
+    return yf.download(
+        list(tickers.values()),
+        period="5d",
+        interval="1d",
+        group_by="ticker",
+        progress=False,
+        threads=True,
+        session=_YF_SESSION,
+    )
+
+
+def extract_latest_ohlc(symbol_name: str, yf_symbol: str, df) -> Dict[str, Any]:
+    """
+    download_all_history() の結果から指定シンボルの直近1日の OHLC を
+    取り出して、Supabase に入れやすい dict にして返す。
+    取得できなければ RuntimeError を投げる。
+    """
+    # 祝日などでシンボルごとに欠損日があるため、NaN 行は落とす
+    hist = df[yf_symbol].dropna(how="all")
 
     if hist.empty:
         raise RuntimeError(
@@ -96,10 +130,11 @@ def fetch_latest_ohlc(symbol_name: str, yf_symbol: str) -> Dict[str, Any]:
     ohlc = {
         "symbol": symbol_name,
         "date": d.isoformat(),       # テーブルは date 型なので YYYY-MM-DD 文字列でOK
-        "open": float(latest["Open"]),
-        "high": float(latest["High"]),
-        "low": float(latest["Low"]),
-        "close": float(latest["Close"]),
+        # 値はすでに numpy の float64 なので、float() を通さず .item() で直接 Python float にする
+        "open": latest["Open"].item(),
+        "high": latest["High"].item(),
+        "low": latest["Low"].item(),
+        "close": latest["Close"].item(),
     }
     return ohlc
 
@@ -107,29 +142,36 @@ def fetch_latest_ohlc(symbol_name: str, yf_symbol: str) -> Dict[str, Any]:
 # Supabase 保存
 # =========================================================
 
-def upsert_ohlc(row: Dict[str, Any]) -> None:
+def upsert_ohlc_batch(rows: list[Dict[str, Any]]) -> None:
     """
-    volatility_prices に upsert。
+    volatility_prices に全シンボル分をまとめて 1 回で upsert。
     symbol + date は UNIQUE 制約を付けている前提なので、
     on_conflict に "symbol,date" を指定します。
     """
+    if not rows:
+        return
+
     response = (
         supabase
         .table(VOL_TABLE)
-        .upsert(row, on_conflict="symbol,date")
+        .upsert(rows, on_conflict="symbol,date")
         .execute()
     )
 
-    # デバッグ用：挿入された（or 更新された）行が返ってくる
-    print("    upsert result:", response.data)
+    # デバッグ用：挿入された（or 更新された）行が返ってくる。
+    # repr の構築自体が重いので、DEBUG が有効なときだけ評価する
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("upsert result: %s", response.data)
 
 # =========================================================
 # メール送信ヘルパー
 # =========================================================
 
-def send_alert_email(to_email: str, subject: str, body: str) -> bool:
+class SmtpSession:
     """
-    SMTP を使ってシンプルなテキストメールを送信。
+    ログイン済みの SMTP コネクションを 1 本だけ張って、
+    複数メールの送信に使い回すための非同期コンテキストマネージャ
+    （aiosmtplib ベースなので送信中もイベントループをブロックしない）。
     .env から以下を読む想定：
       SMTP_HOST (省略時: smtp.gmail.com)
       SMTP_PORT (省略時: 587)
@@ -137,49 +179,80 @@ def send_alert_email(to_email: str, subject: str, body: str) -> bool:
       SMTP_PASS
       FROM_EMAIL (省略時: SMTP_USER)
     """
-    host = os.getenv("SMTP_HOST", "smtp.gmail.com")
-    port = int(os.getenv("SMTP_PORT", "587"))
-    user = os.getenv("SMTP_USER")
-    password = os.getenv("SMTP_PASS")
-    from_email = os.getenv("FROM_EMAIL") or user
-
-    if not user or not password or not from_email:
-        print("    [WARN] SMTP_USER / SMTP_PASS / FROM_EMAIL が設定されていないため、メール送信をスキップします。")
-        return False
-
-    msg = MIMEText(body, "plain", "utf-8")
-    msg["Subject"] = subject
-    msg["From"] = formataddr(("Volatility Alert", from_email))
-    msg["To"] = to_email
-
-    try:
-        with smtplib.SMTP(host, port) as server:
-            server.starttls()
-            server.login(user, password)
-            server.send_message(msg)
-        print(f"    [MAIL] Sent to {to_email}")
-        return True
-    except Exception as e:
-        print(f"    [MAIL ERROR] {e}")
-        return False
-
-def send_welcome_emails_for_new_rules() -> None:
+
+    def __init__(self) -> None:
+        self.host = os.getenv("SMTP_HOST", "smtp.gmail.com")
+        self.port = int(os.getenv("SMTP_PORT", "587"))
+        self.user = os.getenv("SMTP_USER")
+        self.password = os.getenv("SMTP_PASS")
+        self.from_email = os.getenv("FROM_EMAIL") or self.user
+        self._server: aiosmtplib.SMTP | None = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.user and self.password and self.from_email)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        server = aiosmtplib.SMTP(hostname=self.host, port=self.port, start_tls=True)
+        await server.connect()
+        await server.login(self.user, self.password)
+        return server
+
+    async def send(self, to_email: str, subject: str, body: str) -> bool:
+        if not self.configured:
+            logger.warning("SMTP_USER / SMTP_PASS / FROM_EMAIL が設定されていないため、メール送信をスキップします。")
+            return False
+
+        msg = MIMEText(body, "plain", "utf-8")
+        msg["Subject"] = subject
+        msg["From"] = formataddr(("Volatility Alert", self.from_email))
+        msg["To"] = to_email
+
+        try:
+            if self._server is None:
+                self._server = await self._connect()
+            try:
+                await self._server.send_message(msg)
+            except aiosmtplib.SMTPServerDisconnected:
+                # サーバ側から切られていたら張り直して 1 回だけリトライ
+                self._server = await self._connect()
+                await self._server.send_message(msg)
+            logger.info("[MAIL] Sent to %s", to_email)
+            return True
+        except Exception as e:
+            logger.error("[MAIL ERROR] %s", e)
+            return False
+
+    async def __aenter__(self) -> "SmtpSession":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._server is not None:
+            try:
+                await self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+async def send_welcome_emails_for_new_rules() -> None:
     """
     enabled = true かつ welcome_sent = false のルールを取得し、
     メールアドレスごとに1通だけ welcome メールを送る。
     送信後、そのメールアドレスのルールの welcome_sent を true に更新する。
     """
-    res = (
-        supabase
-        .table(ALERT_TABLE)
-        .select("*")
-        .eq("enabled", True)
-        .eq("welcome_sent", False)
-        .execute()
+    res = await asyncio.to_thread(
+        lambda: (
+            supabase
+            .table(ALERT_TABLE)
+            .select("*")
+            .eq("enabled", True)
+            .eq("welcome_sent", False)
+            .execute()
+        )
     )
     rules: list[Dict[str, Any]] = res.data or []
     if not rules:
-        print("=== No new alert rules for welcome email. ===")
+        logger.info("No new alert rules for welcome email.")
         return
 
     # email ごとにグループ化
@@ -188,25 +261,56 @@ def send_welcome_emails_for_new_rules() -> None:
         email = rule["email"]
         rules_by_email.setdefault(email, []).append(rule)
 
-    print(f"=== Sending welcome emails for {len(rules_by_email)} addresses ===")
-
-    for email, rules_for_email in rules_by_email.items():
-        subject, body = build_welcome_email_for_email(email, rules_for_email)
-        sent = send_alert_email(email, subject, body)
-        if not sent:
-            continue
-
-        # このメールアドレスのルールはすべて welcome_sent = true にする
-        try:
-            supabase.table(ALERT_TABLE) \
-                .update({"welcome_sent": True}) \
-                .eq("email", email) \
-                .execute()
-        except Exception as e:
-            print(f"[WELCOME UPDATE ERROR email={email}] {e}")
-
-
-def build_threshold_alert_email(rule: Dict[str, Any], price: float) -> tuple[str, str]:
+    logger.info("Sending welcome emails for %d addresses", len(rules_by_email))
+
+    # 複数アドレスでも SMTP コネクションは 1 本を使い回す
+    async with SmtpSession() as smtp:
+        for email, rules_for_email in rules_by_email.items():
+            subject, body = build_welcome_email_for_email(email, rules_for_email)
+            sent = await smtp.send(email, subject, body)
+            if not sent:
+                continue
+
+            # このメールアドレスのルールはすべて welcome_sent = true にする
+            try:
+                await asyncio.to_thread(
+                    lambda email=email: (
+                        supabase.table(ALERT_TABLE)
+                        .update({"welcome_sent": True})
+                        .eq("email", email)
+                        .execute()
+                    )
+                )
+            except Exception as e:
+                logger.error("[WELCOME UPDATE ERROR email=%s] %s", email, e)
+
+# アラートメールはルールごとに本文リストを組み立て直さず、
+# モジュールロード時に結合済みのテンプレートへ埋め込むだけにする
+_ALERT_SUBJECT_TMPL = "[Volatility Alert] {symbol_label} がアラート水準を超えました"
+
+_ALERT_BODY_TMPL = "\n".join([
+    "このメールは Volatility Dashboard のボラティリティ・アラート機能から自動送信されています。",
+    "",
+    "▼アラートが発生しました",
+    "  対象指標 : {symbol_label} ({symbol})",
+    "  判定条件 : {symbol} {direction} {threshold}",
+    "  現在の終値 : {price:.2f}",
+    "  重要度     : {severity_label}",
+    "",
+    "▼グラフ・アラートの確認",
+    f"  ダッシュボード : {FRONTEND_BASE_URL}",
+    f"  アラートの確認・解除 : {ALERTS_PAGE_URL}",
+    "",
+    "※今後このアラートを停止したい場合は、上記のアラート管理ページから対象のチェックを外してください。",
+    "※本メールは情報提供のみを目的としており、特定の投資行動を推奨するものではありません。",
+    "",
+    "トリガー時刻 (UTC): {triggered_at}",
+])
+
+
+def build_threshold_alert_email(
+    rule: Dict[str, Any], price: float, triggered_at: datetime
+) -> tuple[str, str]:
     symbol = rule["symbol_code"]
     direction = rule["direction"]
     threshold = float(rule["threshold"])
@@ -215,27 +319,17 @@ def build_threshold_alert_email(rule: Dict[str, Any], price: float) -> tuple[str
     symbol_label = SYMBOL_LABELS.get(symbol, symbol)
     severity_label = SEVERITY_LABELS.get(severity, severity)
 
-    subject = f"[Volatility Alert] {symbol_label} がアラート水準を超えました"
-
-    body_lines = [
-        "このメールは Volatility Dashboard のボラティリティ・アラート機能から自動送信されています。",
-        "",
-        "▼アラートが発生しました",
-        f"  対象指標 : {symbol_label} ({symbol})",
-        f"  判定条件 : {symbol} {direction} {threshold}",
-        f"  現在の終値 : {price:.2f}",
-        f"  重要度     : {severity_label}",
-        "",
-        "▼グラフ・アラートの確認",
-        f"  ダッシュボード : {FRONTEND_BASE_URL}",
-        f"  アラートの確認・解除 : {ALERTS_PAGE_URL}",
-        "",
-        "※今後このアラートを停止したい場合は、上記のアラート管理ページから対象のチェックを外してください。",
-        "※本メールは情報提供のみを目的としており、特定の投資行動を推奨するものではありません。",
-        "",
-        f"トリガー時刻 (UTC): {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')}",
-    ]
-    return subject, "\n".join(body_lines)
+    subject = _ALERT_SUBJECT_TMPL.format(symbol_label=symbol_label)
+    body = _ALERT_BODY_TMPL.format(
+        symbol=symbol,
+        symbol_label=symbol_label,
+        direction=direction,
+        threshold=threshold,
+        price=price,
+        severity_label=severity_label,
+        triggered_at=triggered_at.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    return subject, body
 
 def build_welcome_email_for_email(email: str, rules: list[Dict[str, Any]]) -> tuple[str, str]:
     """
@@ -284,115 +378,174 @@ def build_welcome_email_for_email(email: str, rules: list[Dict[str, Any]]) -> tu
 # アラートルール判定
 # =========================================================
 
-def load_enabled_alert_rules() -> list[Dict[str, Any]]:
+def load_enabled_alert_rules(symbols: list[str]) -> list[Dict[str, Any]]:
     """
-    alert_rules テーブルから enabled = true のルールを全件取得。
+    alert_rules テーブルから enabled = true のルールを取得。
+    今回価格が取れたシンボルのルールだけをサーバ側で絞り込む。
     """
     res = (
         supabase
         .table(ALERT_TABLE)
         .select("*")
         .eq("enabled", True)
+        .in_("symbol_code", symbols)
         .execute()
     )
     rules: list[Dict[str, Any]] = res.data or []
-    print(f"=== Loaded {len(rules)} enabled alert rules ===")
+    logger.info("Loaded %d enabled alert rules", len(rules))
     return rules
 
-def evaluate_alerts(latest_close: Dict[str, float]) -> None:
+async def evaluate_alerts(latest_close: Dict[str, float]) -> None:
     """
     latest_close: {"VIX": 23.4, "NIKKEI_VI": 37.2, ...}
     を使って alert_rules を評価し、
     False → True に変わったルールだけメール送信する（エッジトリガ）。
     """
-    rules = load_enabled_alert_rules()
-    if not rules:
-        print("=== No enabled alert rules. Skipping alert check. ===")
+    if not latest_close:
+        # 価格が 1 件も取れていないと .in_("symbol_code", []) が
+        # PostgREST のパースエラー（PGRST100）になるので、ここで打ち切る
+        logger.info("No prices fetched. Skipping alert check.")
         return
 
-    for rule in rules:
-        rule_id = rule["id"]
-        symbol = rule["symbol_code"]      # 'VIX' / 'NIKKEI_VI'
-        direction = rule["direction"]     # いまは '>=' 前提
-        threshold = float(rule["threshold"])
-        severity = rule.get("severity") or "notice"
-        email = rule["email"]
-        last_result = rule.get("last_result")  # True / False / None
-
-        price = latest_close.get(symbol)
-        if price is None:
-            # まだこの銘柄の価格を取っていない場合
-            print(f"[RULE {rule_id}] {symbol}: 最新価格がないためスキップ")
-            continue
+    rules = await asyncio.to_thread(
+        load_enabled_alert_rules, list(latest_close.keys())
+    )
+    if not rules:
+        logger.info("No enabled alert rules. Skipping alert check.")
+        return
 
-        # いまの判定
-        if direction == ">=":
-            now_result = price >= threshold
-        else:
-            # 将来 '<=' など増やしたくなった場合の保険
-            print(f"[RULE {rule_id}] 未対応の direction: {direction} -> スキップ")
-            continue
+    # 更新内容はループ中にためておき、ループ後にまとめて反映する
+    updates: list[Dict[str, Any]] = []
 
-        prev_result = bool(last_result) if last_result is not None else False
+    # シンボルごとにルールをまとめておき、
+    # 今回価格が取れたシンボルのルールだけを評価する
+    rules_by_symbol: dict[str, list[Dict[str, Any]]] = defaultdict(list)
+    for rule in rules:
+        rules_by_symbol[rule["symbol_code"]].append(rule)
+
+    # トリガー時刻は run 内で 1 回だけ計算して全ルールで使い回す
+    now_utc = datetime.now(timezone.utc)
+
+    # 同時に複数ルールが発火しても SMTP コネクションは 1 本を使い回す
+    async with SmtpSession() as smtp:
+        for symbol, price in latest_close.items():
+            for rule in rules_by_symbol.get(symbol, ()):
+                rule_id = rule["id"]
+                direction = rule["direction"]     # いまは '>=' 前提
+                threshold = float(rule["threshold"])
+                severity = rule.get("severity") or "notice"
+                email = rule["email"]
+                last_result = rule.get("last_result")  # True / False / None
+
+                # いまの判定
+                if direction == ">=":
+                    now_result = price >= threshold
+                else:
+                    # 将来 '<=' など増やしたくなった場合の保険
+                    logger.warning("[RULE %s] 未対応の direction: %s -> スキップ", rule_id, direction)
+                    continue
+
+                prev_result = bool(last_result) if last_result is not None else False
+
+                logger.debug(
+                    "[RULE %s] %s %s %s? price=%.2f prev=%s now=%s",
+                    rule_id, symbol, direction, threshold, price, prev_result, now_result,
+                )
+
+                # 更新内容はとりあえず現在の判定を保存
+                update_fields: Dict[str, Any] = {"id": rule_id, "last_result": now_result}
+
+                # False -> True になった瞬間だけメール送信
+                if now_result and not prev_result:
+                    subject, body = build_threshold_alert_email(rule, price, now_utc)
+                    sent = await smtp.send(email, subject, body)
+                    if sent:
+                        update_fields["last_triggered_at"] = now_utc.isoformat()
+
+                # True -> False / False -> False のときは last_result だけ更新
+                updates.append(update_fields)
+
+    # 全ルール分の判定結果を反映する。
+    # 発火したルールだけ last_triggered_at を持つためキーが揃わず、
+    # キー混在の bulk upsert は PostgREST に拒否される（PGRST102）。
+    # また upsert は INSERT 経路で NOT NULL 制約を踏むので、
+    # ルールごとの UPDATE を並行に投げる
+    if updates:
+        def update_one(fields: Dict[str, Any]):
+            payload = {k: v for k, v in fields.items() if k != "id"}
+            return (
+                supabase
+                .table(ALERT_TABLE)
+                .update(payload)
+                .eq("id", fields["id"])
+                .execute()
+            )
 
-        print(
-            f"[RULE {rule_id}] {symbol} {direction} {threshold}?"
-            f" price={price:.2f} prev={prev_result} now={now_result}"
+        results = await asyncio.gather(
+            *(asyncio.to_thread(update_one, fields) for fields in updates),
+            return_exceptions=True,
         )
-
-        # 更新内容はとりあえず現在の判定を保存
-        update_fields: Dict[str, Any] = {"last_result": now_result}
-
-        # False -> True になった瞬間だけメール送信
-        if now_result and not prev_result:
-            subject, body = build_threshold_alert_email(rule, price)
-            sent = send_alert_email(email, subject, body)
-            if sent:
-                update_fields["last_triggered_at"] = datetime.now(timezone.utc).isoformat()
-
-        # True -> False / False -> False のときは last_result だけ更新
-
-        # ルール行を更新
-        try:
-            supabase.table(ALERT_TABLE).update(update_fields).eq("id", rule_id).execute()
-        except Exception as e:
-            print(f"    [RULE {rule_id} UPDATE ERROR] {e}")
+        for fields, res in zip(updates, results):
+            if isinstance(res, Exception):
+                logger.error("[RULE %s UPDATE ERROR] %s", fields["id"], res)
 
 # =========================================================
 # メイン処理
 # =========================================================
 
-def main() -> None:
-    print("=== Volatility fetch & save & alert ===")
+async def main() -> None:
+    logger.info("=== Volatility fetch & save & alert ===")
 
     # 各シンボルの最新終値を集める
     latest_close: Dict[str, float] = {}
 
-    for logical_name, yf_symbol in INDEX_TICKERS.items():
-        print(f"\n[+] Fetching {logical_name} ({yf_symbol}) ...")
-
-        try:
-            ohlc = fetch_latest_ohlc(logical_name, yf_symbol)
-        except Exception as e:
-            # 1つ失敗しても、他の指数処理は続ける
-            print(f"    [ERROR] {logical_name} の取得に失敗しました: {e}")
-            continue
-
-        print("    latest OHLC:", ohlc)
-
-        print("    -> Upserting into Supabase ...")
-        upsert_ohlc(ohlc)
-        print("    Done.")
+    # すでに当日分が upsert 済みのシンボルは yfinance を呼ばない
+    # （1日2回の cron なら 2 回目の取得を丸ごと省ける）
+    today_iso = date.today().isoformat()
+    stored = await load_latest_stored_rows()
 
-        latest_close[logical_name] = ohlc["close"]
-
-    print("\n=== Checking alert rules ===")
-    evaluate_alerts(latest_close)
-
-    print("\n=== Sending welcome emails for new rules ===")
-    send_welcome_emails_for_new_rules()
+    stale_tickers: Dict[str, str] = {}
+    for logical_name, yf_symbol in INDEX_TICKERS.items():
+        stored_row = stored.get(logical_name)
+        if stored_row and stored_row["date"] == today_iso:
+            logger.info("%s は当日分が保存済みのため取得をスキップ", logical_name)
+            latest_close[logical_name] = float(stored_row["close"])
+        else:
+            stale_tickers[logical_name] = yf_symbol
+
+    all_rows: list[Dict[str, Any]] = []
+
+    if stale_tickers:
+        # 未取得のシンボルだけを 1 回のリクエストでまとめて取得
+        logger.info("Downloading %d symbols in one batch ...", len(stale_tickers))
+        df = await asyncio.to_thread(download_all_history, stale_tickers)
+
+        for logical_name, yf_symbol in stale_tickers.items():
+            try:
+                ohlc = extract_latest_ohlc(logical_name, yf_symbol, df)
+            except Exception as e:
+                # 1つ失敗しても、他の指数処理は続ける
+                logger.error("%s の取得に失敗しました: %s", logical_name, e)
+                continue
+
+            logger.info("Extracted %s (%s)", logical_name, yf_symbol)
+            logger.debug("latest OHLC: %s", ohlc)
+
+            all_rows.append(ohlc)
+            latest_close[logical_name] = ohlc["close"]
+    else:
+        logger.info("全シンボルが当日分まで保存済みのため、yfinance の取得をスキップ")
+
+    # 価格の upsert・アラート判定・welcome メールは互いに独立なので、
+    # 3 ステージを並行に走らせてネットワーク待ちを重ねる
+    logger.info("Upserting rows / checking alerts / sending welcome emails ...")
+    await asyncio.gather(
+        asyncio.to_thread(upsert_ohlc_batch, all_rows),
+        evaluate_alerts(latest_close),
+        send_welcome_emails_for_new_rules(),
+    )
 
-    print("\nAll symbols processed & alerts checked.")
+    logger.info("All symbols processed & alerts checked.")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
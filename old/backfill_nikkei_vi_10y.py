@@ -2,59 +2,59 @@
 # NIKKEI_VI を yfinance から period="max" で取得し、
 # Supabase の VIX データ期間に合わせてトリミングして upsert する
 
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import date, datetime
 import os
 
 import yfinance as yf
-from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
 
 
-def create_supabase_client() -> Client:
-    """同じフォルダの .env から Supabase クライアントを作成"""
-    env_path = Path(__file__).with_name(".env")
-    load_dotenv(env_path)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
 
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_SECRET_KEY")
-
-    if not url or not key:
-        raise RuntimeError("SUPABASE_URL / SUPABASE_SECRET_KEY が .env にありません。")
-
-    return create_client(url, key)
+# リポジトリ直下の共有 supabase_client を import できるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from supabase_client import get_client
 
 
 def get_vix_date_range(supabase: Client) -> tuple[date | None, date | None]:
     """
     volatility_prices から VIX の日付範囲 (min_date, max_date) を取得。
     VIX が 1 行もなければ (None, None) を返す。
-    """
-    # 最古の日付（昇順で最初の1件）
-    res_min = (
-        supabase.table("volatility_prices")
-        .select("date")
-        .eq("symbol", "VIX")
-        .order("date")             # ← ascending=True を削除
-        .limit(1)
-        .execute()
-    )
 
-    # 最新の日付（降順で最初の1件）
-    res_max = (
-        supabase.table("volatility_prices")
-        .select("date")
-        .eq("symbol", "VIX")
-        .order("date", desc=True)  # ← ascending=False の代わりに desc=True
-        .limit(1)
+    以前は昇順/降順の select を 2 回投げていたが、
+    MIN/MAX をまとめて返す RPC 1 回で済ませる。
+    Supabase 側には以下の関数を作成しておく：
+
+        create or replace function get_symbol_date_range(p_symbol text)
+        returns table (min_date date, max_date date)
+        language sql stable as $$
+            select min(date), max(date)
+            from volatility_prices
+            where symbol = p_symbol;
+        $$;
+    """
+    res = (
+        supabase.rpc("get_symbol_date_range", {"p_symbol": "VIX"})
         .execute()
     )
 
-    if not res_min.data or not res_max.data:
+    if not res.data:
         return None, None
 
-    min_str = res_min.data[0]["date"]  # "YYYY-MM-DD"
-    max_str = res_max.data[0]["date"]
+    row = res.data[0]
+    min_str = row["min_date"]  # "YYYY-MM-DD"
+    max_str = row["max_date"]
+
+    if min_str is None or max_str is None:
+        return None, None
 
     min_date = datetime.fromisoformat(min_str).date()
     max_date = datetime.fromisoformat(max_str).date()
@@ -63,16 +63,16 @@ def get_vix_date_range(supabase: Client) -> tuple[date | None, date | None]:
 
 
 def main() -> None:
-    supabase = create_supabase_client()
+    supabase = get_client()
 
     # 1. まず VIX の日付範囲を取得
     vix_min, vix_max = get_vix_date_range(supabase)
     if vix_min is None or vix_max is None:
-        print("VIX のデータが volatility_prices に存在しないため、範囲を揃えられません。")
-        print("先に VIX をバックフィルしてから再実行してください。")
+        logger.warning("VIX のデータが volatility_prices に存在しないため、範囲を揃えられません。")
+        logger.warning("先に VIX をバックフィルしてから再実行してください。")
         return
 
-    print(f"VIX date range: {vix_min} 〜 {vix_max}")
+    logger.info("VIX date range: %s 〜 %s", vix_min, vix_max)
 
     # 2. 日経平均ボラティリティ・インデックス（Osaka）を period="max" で取得
     ticker = yf.Ticker("^NKVI.OS")
@@ -82,64 +82,62 @@ def main() -> None:
         raise RuntimeError("NIKKEI_VI のヒストリカルデータが取得できませんでした。")
 
     # 3. VIX の日付範囲でトリミング
-    # hist.index は DatetimeIndex なので、index.date を使ってフィルタ
-    idx_dates = hist.index.date
-    mask = (idx_dates >= vix_min) & (idx_dates <= vix_max)
-    hist_trimmed = hist.loc[mask]
+    # index.date は 1 要素ずつ Python の date オブジェクトを作るので遅い。
+    # DatetimeIndex のラベルスライスなら C 実装の範囲検索で済む
+    hist_trimmed = hist.loc[vix_min.isoformat() : vix_max.isoformat()]
 
     if hist_trimmed.empty:
         raise RuntimeError("VIX と重なる日付範囲に NIKKEI_VI のデータがありません。")
 
-    print(f"Trimmed NIKKEI_VI rows: {len(hist_trimmed)}")
+    logger.info("Trimmed NIKKEI_VI rows: %d", len(hist_trimmed))
 
     # 4. Supabase に upsert
-    rows: list[dict] = []
-    for idx, row in hist_trimmed.iterrows():
-        d: date = idx.date()
-
-        close_val = row["Close"]
-
-        # 終値が本当に NaN / None の日はスキップ
-        if close_val is None or (isinstance(close_val, float) and close_val != close_val):
-            continue
-
-        # 他のOHLCが NaN なら close で埋める
-        open_val = row["Open"]
-        high_val = row["High"]
-        low_val = row["Low"]
-
-        if isinstance(open_val, float) and open_val != open_val:
-            open_val = close_val
-        if isinstance(high_val, float) and high_val != high_val:
-            high_val = close_val
-        if isinstance(low_val, float) and low_val != low_val:
-            low_val = close_val
-
-        rows.append(
-            {
-                "symbol": "NIKKEI_VI",
-                "date": d.isoformat(),
-                "open": float(open_val),
-                "high": float(high_val),
-                "low": float(low_val),
-                "close": float(close_val),
-            }
-        )
+    # 1行ずつ iterrows で回すと Python 側のオーバーヘッドが大きいので、
+    # NaN 処理も行 dict 化も pandas のベクトル演算でまとめてやる
+    hist_trimmed = hist_trimmed.copy()
+
+    # 終値が本当に NaN の日はスキップ
+    hist_trimmed = hist_trimmed.dropna(subset=["Close"])
+
+    # 他のOHLCが NaN なら close で埋める
+    for col in ["Open", "High", "Low"]:
+        hist_trimmed[col] = hist_trimmed[col].fillna(hist_trimmed["Close"])
+
+    hist_trimmed = hist_trimmed.rename(
+        columns={"Open": "open", "High": "high", "Low": "low", "Close": "close"}
+    )
+    hist_trimmed["symbol"] = "NIKKEI_VI"
+    hist_trimmed["date"] = hist_trimmed.index.strftime("%Y-%m-%d")
+
+    rows: list[dict] = (
+        hist_trimmed[["symbol", "date", "open", "high", "low", "close"]]
+        .astype({"open": float, "high": float, "low": float, "close": float})
+        .to_dict("records")
+    )
 
     if not rows:
         raise RuntimeError("有効な NIKKEI_VI 行がありませんでした。")
 
-    batch_size = 200
-    for i in range(0, len(rows), batch_size):
-        chunk = rows[i : i + batch_size]
-        res = (
+    # PostgREST のラウンドトリップを減らすため、1 バッチを大きめに取る
+    batch_size = 2000
+    chunks = [rows[i : i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    def upsert_chunk(chunk: list[dict]):
+        return (
             supabase.table("volatility_prices")
             .upsert(chunk, on_conflict="symbol,date")
             .execute()
         )
-        print(f"batch {i // batch_size + 1}: {len(res.data)} rows upserted")
 
-    print("DONE: NIKKEI_VI daily history (aligned with VIX range) imported.")
+    # 各バッチは別々の行なので並列に投げても安全。
+    # Supabase free tier を考慮して 4 並列から始める（429 が出ない範囲で調整）
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        for n, res in enumerate(ex.map(upsert_chunk, chunks), start=1):
+            # バッチごとの行 repr 生成は重いので DEBUG のときだけ
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("batch %d: %d rows upserted", n, len(res.data))
+
+    logger.info("DONE: NIKKEI_VI daily history (aligned with VIX range) imported.")
 
 
 if __name__ == "__main__":
@@ -1,29 +1,28 @@
 # backfill_vix_10y.py
 
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import date
 import os
 
 import yfinance as yf
-from dotenv import load_dotenv
-from supabase import create_client, Client
 
 
-def create_supabase_client() -> Client:
-    env_path = Path(__file__).with_name(".env")
-    load_dotenv(env_path)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
 
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_SECRET_KEY")
-
-    if not url or not key:
-        raise RuntimeError("SUPABASE_URL / SUPABASE_SECRET_KEY が .env にありません。")
-
-    return create_client(url, key)
+# リポジトリ直下の共有 supabase_client を import できるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from supabase_client import get_client
 
 
 def main() -> None:
-    supabase = create_supabase_client()
+    supabase = get_client()
 
     ticker = yf.Ticker("^VIX")
 
@@ -48,17 +47,26 @@ def main() -> None:
         )
 
     # 既存の main.py と同じく upsert
-    batch_size = 200
-    for i in range(0, len(rows), batch_size):
-        chunk = rows[i : i + batch_size]
-        res = (
+    # PostgREST のラウンドトリップを減らすため、1 バッチを大きめに取る
+    batch_size = 2000
+    chunks = [rows[i : i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    def upsert_chunk(chunk: list[dict]):
+        return (
             supabase.table("volatility_prices")
             .upsert(chunk, on_conflict="symbol,date")
             .execute()
         )
-        print(f"batch {i // batch_size + 1}: {len(res.data)} rows upserted")
 
-    print("DONE: VIX 10-year daily history imported.")
+    # 各バッチは別々の行なので並列に投げても安全。
+    # Supabase free tier を考慮して 4 並列から始める（429 が出ない範囲で調整）
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        for n, res in enumerate(ex.map(upsert_chunk, chunks), start=1):
+            # バッチごとの行 repr 生成は重いので DEBUG のときだけ
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("batch %d: %d rows upserted", n, len(res.data))
+
+    logger.info("DONE: VIX 10-year daily history imported.")
 
 
 if __name__ == "__main__":
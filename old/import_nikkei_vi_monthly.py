@@ -1,41 +1,43 @@
 # import_nikkei_vi_monthly.py
 
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 import os
 
 import pandas as pd
-from dotenv import load_dotenv
-from supabase import create_client, Client
 
 
-def create_supabase_client() -> Client:
-    """同じフォルダの .env から Supabase クライアントを作成"""
-    env_path = Path(__file__).with_name(".env")
-    load_dotenv(env_path)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(message)s",
+)
+logger = logging.getLogger(__name__)
 
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_SECRET_KEY")
-
-    if not url or not key:
-        raise RuntimeError("SUPABASE_URL / SUPABASE_SECRET_KEY が .env にありません。")
-
-    return create_client(url, key)
+# リポジトリ直下の共有 supabase_client を import できるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from supabase_client import get_client
 
 
 def main() -> None:
-    supabase = create_supabase_client()
+    supabase = get_client()
 
     # CSV パス（同じフォルダに置いた前提）
     csv_path = Path(__file__).with_name("nikkei_vi_monthly.csv")
 
-    # 日経のCSVは Shift-JIS 系なので cp932 で読む
-    df = pd.read_csv(csv_path, encoding="cp932")
-
-    # デバッグ用：カラム名を確認したいとき
-    # print(df.head())
+    # 日経のCSVは Shift-JIS 系なので cp932 で読む。
+    # 使うカラムと価格カラムの dtype を指定して、
+    # 余計なカラムの読み込みと dtype 推定を省く
+    df = pd.read_csv(
+        csv_path,
+        encoding="cp932",
+        usecols=["データ日付", "始値", "高値", "安値", "終値"],
+        dtype={"始値": float, "高値": float, "安値": float, "終値": float},
+    )
 
-    # 「データ日付」を datetime に変換。変換できなかった行（注意書き）は NaT になる
+    # 「データ日付」を datetime に変換。変換できなかった行（末尾の注意書き）は NaT になる
     df["parsed_date"] = pd.to_datetime(
         df["データ日付"], format="%Y/%m/%d", errors="coerce"
     )
@@ -43,33 +45,39 @@ def main() -> None:
     # 日付に変換できた行だけ残す（注意書き行を削除）
     df = df[df["parsed_date"].notna()]
 
-    rows = []
-    for _, r in df.iterrows():
-        d = r["parsed_date"].date().isoformat()
-
-        rows.append(
-            {
-                "symbol": "NIKKEI_VI",
-                "date": d,
-                "open": float(r["始値"]),
-                "high": float(r["高値"]),
-                "low": float(r["安値"]),
-                "close": float(r["終値"]),
-            }
-        )
+    # iterrows は 1 行ごとに Series を作るので遅い。
+    # 列のリネームと dict 化をまとめてベクトル処理する
+    df = df.rename(columns={"始値": "open", "高値": "high", "安値": "low", "終値": "close"})
+    df["symbol"] = "NIKKEI_VI"
+    df["date"] = df["parsed_date"].dt.strftime("%Y-%m-%d")
+
+    # 価格カラムは read_csv の時点で float なので、ここでの astype は不要
+    rows = (
+        df[["symbol", "date", "open", "high", "low", "close"]]
+        .to_dict("records")
+    )
 
     # まとめて upsert（symbol + date でユニーク）
-    batch_size = 200
-    for i in range(0, len(rows), batch_size):
-        chunk = rows[i : i + batch_size]
-        res = (
+    # PostgREST のラウンドトリップを減らすため、1 バッチを大きめに取る
+    batch_size = 2000
+    chunks = [rows[i : i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    def upsert_chunk(chunk: list[dict]):
+        return (
             supabase.table("volatility_prices")
             .upsert(chunk, on_conflict="symbol,date")
             .execute()
         )
-        print(f"batch {i // batch_size + 1}: {len(res.data)} rows upserted")
 
-    print("DONE: Nikkei VI monthly history imported.")
+    # 各バッチは別々の行なので並列に投げても安全。
+    # Supabase free tier を考慮して 4 並列から始める（429 が出ない範囲で調整）
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        for n, res in enumerate(ex.map(upsert_chunk, chunks), start=1):
+            # バッチごとの行 repr 生成は重いので DEBUG のときだけ
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("batch %d: %d rows upserted", n, len(res.data))
+
+    logger.info("DONE: Nikkei VI monthly history imported.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+# supabase_client.py
+# main.py と old/ のバックフィルスクリプトで共有する Supabase クライアント
+
+import functools
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from supabase import create_client, Client
+
+logger = logging.getLogger(__name__)
+
+
+@functools.lru_cache(maxsize=1)
+def get_client() -> Client:
+    """
+    supabase_client.py と同じフォルダの .env から
+    SUPABASE_URL / SUPABASE_SECRET_KEY を読み込んでクライアントを生成。
+
+    lru_cache で 1 プロセスにつき 1 クライアントに抑えるので、
+    複数スクリプトを同一プロセスで順に走らせても .env の読み直しや
+    HTTP コネクションプールの作り直しが発生しない。
+    """
+    env_path = Path(__file__).with_name(".env")
+    # OS環境変数より .env を優先させる
+    load_dotenv(dotenv_path=env_path, override=True)
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_SECRET_KEY")
+
+    # デバッグ用
+    logger.debug("SUPABASE_URL: %s", url)
+    logger.debug("SUPABASE_SECRET_KEY length: %d", len(key) if key else 0)
+
+    if not url or not key:
+        raise RuntimeError(
+            "SUPABASE_URL / SUPABASE_SECRET_KEY が .env に設定されていません。"
+        )
+
+    return create_client(url, key)